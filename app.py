@@ -1,14 +1,29 @@
 """
 Streamlit Mock Exam App — tailored for two-column bilingual PDFs (English pages alternate)
 Run:
-  pip install streamlit pdfplumber reportlab
+  pip install streamlit numpy pdfplumber pymupdf pypdf reportlab
   streamlit run app.py
 """
 
 import streamlit as st
+import numpy as np
 import pdfplumber
+import pypdf
+try:
+    import fitz  # PyMuPDF — much faster text extraction; optional
+except ImportError:
+    fitz = None
+try:
+    from numba import njit  # optional JIT for the scoring loop
+except ImportError:
+    njit = None
+import itertools
+import math
+import os
 import re
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from io import BytesIO
@@ -16,17 +31,203 @@ from io import BytesIO
 st.set_page_config(page_title="Mock Exam Interface", layout="wide")
 st.title("📘 Mock Exam Interface — Two-column bilingual-aware (100 Qs)")
 
+# ---------- Precompiled regexes (module scope — avoids re-cache lookups in hot loops) ----------
+
+_Q_SPLIT_RE = re.compile(r"\n\s*(?=(?:Q\.?\s*)?\d{1,3}[\.)])")
+_Q_HEAD_RE = re.compile(r"^(?:Q\.?\s*)?(\d{1,3})[\.)]\s*(.*)$", re.IGNORECASE | re.DOTALL)
+_OPT_CAPTURE_RE = re.compile(r'^[\s]*([a-dA-D]|[1-4])[\.\)]\s+(.*)$')
+# Cheap prefix gate: labels that can start an option line ("a)", "B.", "1)" ...)
+_OPT_LABELS = frozenset('abcdABCD1234')
+_INLINE_OPT_RE = re.compile(r'\(?([a-dA-D])\)?[\.\)]\s*([^;\\n]+)')
+_LINE_WS_RE = re.compile(r'[ \t]+\n')
+# Answer-key token streams, tiered: the main pass binds Ans letters only to
+# Q-prefixed question numbers (worked solutions are full of bare numbers that
+# must not steal the binding); the fallback pass handles keys without Q
+# prefixes via guarded bare numbers and "1) d" pairs.
+_ANS_Q_TOKEN_RE = re.compile(r'Q\.?\s*(\d{1,3})|Ans\)?\s*[:\-]?\s*([a-dA-D])\b')
+_ANS_BARE_TOKEN_RE = re.compile(
+    r'Ans\)?\s*[:\-]?\s*([a-dA-D])\b'
+    r'|\b(\d{1,3})[\)\.]\s*([a-dA-D])\b'
+    r'|\b(\d{1,3})[\)\.]\s'
+)
+_KEY_LETTER_RE = re.compile(r'(\d{1,3}).?[-:\)]?\s*([A-Da-d1-4])$')
+_KEY_TEXT_RE = re.compile(r'(\d{1,3}).?[-:\)]?\s*(.+)$')
+_DEV_RE = re.compile('[\\u0900-\\u097F]+')
+
+# Shared option-label constants — avoids rebuilding these per question.
+# Interned so every label stored in session_state is the same object and
+# comparisons hit pointer equality first.
+_LETTERS = tuple(sys.intern(c) for c in ('A', 'B', 'C', 'D'))
+_LETTER_SET = frozenset(_LETTERS)
+_NUM_TO_LETTER = dict(zip('1234', _LETTERS))
+_LETTER_TO_IDX = {c: i for i, c in enumerate(_LETTERS)}
+
 # ---------- Helpers for PDF extraction/parsing ----------
 
+def _file_bytes(file):
+    """
+    Read an upload (Streamlit UploadedFile, BytesIO or file object) fully into
+    bytes once. PDF backends do many small seeks, which are much cheaper
+    against an in-memory buffer than through the upload wrapper.
+    """
+    return file.getvalue() if hasattr(file, 'getvalue') else file.read()
+
 def extract_pages_text(file):
-    pages = []
+    """
+    Extract plain text per page (list of strings). Thin wrapper that reads the
+    upload once and delegates to the content-cached extractor.
+    """
+    return _extract_pages_text_cached(_file_bytes(file))
+
+@st.cache_data(show_spinner=False)
+def _extract_pages_text_cached(data):
+    """
+    Extract plain text per page from raw PDF bytes. Prefers PyMuPDF, which
+    opens the bytes as a zero-copy stream; then pypdf, which skips pdfminer's
+    layout analysis; pdfplumber is the last resort. Cached on the file content
+    so reruns never re-extract an unchanged upload.
+    """
+    texts = []
+    if fitz is not None:
+        try:
+            # fitz.open(stream=...) keeps a reference to the bytes — no
+            # per-page re-copying of the upload
+            with fitz.open(stream=data, filetype='pdf') as doc:
+                texts = [(page.get_text() or "") for page in doc]
+        except Exception:
+            texts = []
+    if not any(t.strip() for t in texts):
+        try:
+            n = len(pypdf.PdfReader(BytesIO(data)).pages)
+            workers = min(n, os.cpu_count() or 1)
+            if workers > 1:
+                # pypdf readers are not thread-safe (lazy object resolution
+                # seeks the shared stream), so each worker opens its own
+                # reader over the in-memory bytes and extracts a page stride
+                def _extract_stride(start):
+                    reader = pypdf.PdfReader(BytesIO(data))
+                    return [(i, reader.pages[i].extract_text() or "") for i in range(start, n, workers)]
+                texts = [""] * n
+                with ThreadPoolExecutor(max_workers=workers) as ex:
+                    for pairs in ex.map(_extract_stride, range(workers)):
+                        for i, t in pairs:
+                            texts[i] = t
+            else:
+                reader = pypdf.PdfReader(BytesIO(data))
+                texts = [(page.extract_text() or "") for page in reader.pages]
+        except Exception:
+            texts = []
+    if not any(t.strip() for t in texts):
+        # fallback: pdfplumber tolerates some PDFs pypdf cannot read
+        try:
+            with pdfplumber.open(BytesIO(data)) as pdf:
+                texts = [(page.extract_text() or "") for page in pdf.pages]
+        except Exception as e:
+            st.error(f"Error opening PDF: {e}")
+    return texts
+
+@st.cache_data(show_spinner=False)
+def _extract_all_column_texts(data):
+    """
+    Extract (left_text, right_text) for every page of the PDF given as raw bytes.
+    Cached on the file content, so Streamlit reruns (sidebar toggles, widget
+    changes) reuse the parsed pages instead of reopening the backend.
+
+    Prefers PyMuPDF, which returns positioned text blocks in one C call per
+    page; the blocks are partitioned about the page midline to rebuild the two
+    columns. Falls back to pdfplumber crops when PyMuPDF is unavailable or
+    yields nothing.
+    """
+    if fitz is not None:
+        try:
+            fitz_cols = []
+            with fitz.open(stream=data, filetype='pdf') as doc:
+                for page in doc:
+                    blocks = page.get_text("blocks")
+                    if not blocks:
+                        fitz_cols.append(("", ""))
+                        continue
+                    mid_x = page.rect.width / 2.0
+                    blocks.sort(key=lambda b: (b[1], b[0]))  # top-to-bottom, then left-to-right
+                    left = "\n".join(b[4].strip() for b in blocks if b[0] < mid_x and b[4].strip())
+                    right = "\n".join(b[4].strip() for b in blocks if b[0] >= mid_x and b[4].strip())
+                    fitz_cols.append((left, right))
+            if any(left or right for left, right in fitz_cols):
+                return fitz_cols
+        except Exception:
+            pass  # fall through to pdfplumber
+
+    def _crop_extract(task):
+        page, bbox = task
+        try:
+            return (page.crop(bbox).extract_text() or "").strip()
+        except Exception:
+            return ""
+
+    pages_cols = []
     try:
-        with pdfplumber.open(file) as pdf:
+        with pdfplumber.open(BytesIO(data)) as pdf:
+            tasks = []
+            slots = []  # per page: index of its (left, right) pair in tasks, or None
             for page in pdf.pages:
-                pages.append(page)
+                # Scanned/image-only pages have no chars — skip both
+                # crop+extract passes instead of decoding them for nothing.
+                # (Touching page.chars here also materializes the page's object
+                # cache serially, so the threaded crops below only read it.)
+                if not page.chars:
+                    slots.append(None)
+                    continue
+                # compute midpoint for vertical split
+                width = page.width
+                height = page.height
+                mid_x = width / 2.0
+                # column bboxes: (x0, y0, x1, y1) — pdfplumber coordinates: (0,0) bottom-left
+                tasks.append((page, (0, 0, mid_x, height)))
+                tasks.append((page, (mid_x, 0, width, height)))
+                slots.append(len(tasks) - 2)
+            if tasks:
+                with ThreadPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as ex:
+                    results = list(ex.map(_crop_extract, tasks))
+            else:
+                results = []
+            for slot in slots:
+                pages_cols.append(("", "") if slot is None else (results[slot], results[slot + 1]))
     except Exception as e:
         st.error(f"Error opening PDF: {e}")
-    return pages
+    return pages_cols
+
+def is_page_hindi(text, threshold=0.2, _chunk=4096):
+    """
+    Heuristic: a page is Hindi if at least `threshold` of its characters are
+    Devanagari. Counting runs inside the C regex engine — a per-character
+    Python loop is far too slow for multi-hundred-KB page texts.
+
+    The text is scanned in chunks so we can stop as soon as the outcome is
+    decided: True once the needed count is reached, False once the remaining
+    characters can no longer reach it. English pages typically resolve after
+    the first chunk.
+    """
+    if not text:
+        return False
+    total = len(text)
+    needed = math.ceil(threshold * total)
+    if total > 50_000:
+        # Very large pages: view the codepoints as a uint32 array and do the
+        # range test vectorized; the regex loop below wins for short texts.
+        arr = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        devanagari = int(((arr >= 0x0900) & (arr <= 0x097F)).sum())
+        return devanagari >= needed
+    count = 0
+    remaining = total
+    for start in range(0, total, _chunk):
+        piece = text[start:start + _chunk]
+        remaining -= len(piece)
+        count += sum(len(m) for m in _DEV_RE.findall(piece))
+        if count >= needed:
+            return True
+        if count + remaining < needed:
+            return False
+    return count >= needed
 
 def extract_english_columns_text(file, first_page_hindi=True):
     """
@@ -34,29 +235,18 @@ def extract_english_columns_text(file, first_page_hindi=True):
     This function extracts English pages only, splits each English page into left & right halves,
     and returns a single concatenated text where each column is appended in order (left then right).
     """
-    pages = extract_pages_text(file)
-    if not pages:
+    data = _file_bytes(file)
+    pages_cols = _extract_all_column_texts(data)
+    if not pages_cols:
         return ""
     texts = []
     # Pages list is 0-based; if first_page_hindi True, English pages are indices 1,3,5...
     start_idx = 1 if first_page_hindi else 0
-    for i in range(start_idx, len(pages), 2):
-        page = pages[i]
-        # compute midpoint for vertical split
-        width = page.width
-        height = page.height
-        mid_x = width / 2.0
-        # left column bbox: (x0, y0, x1, y1) — pdfplumber coordinates: (0,0) bottom-left
-        left_bbox = (0, 0, mid_x, height)
-        right_bbox = (mid_x, 0, width, height)
-        try:
-            left_text = (page.crop(left_bbox).extract_text() or "").strip()
-        except Exception:
-            left_text = ""
-        try:
-            right_text = (page.crop(right_bbox).extract_text() or "").strip()
-        except Exception:
-            right_text = ""
+    for left_text, right_text in pages_cols[start_idx::2]:
+        # Guard against broken alternation (e.g. an extra instruction page):
+        # drop pages that are mostly Devanagari even though we expected English.
+        if is_page_hindi(left_text + right_text):
+            continue
         # Append left then right (this preserves typical reading order)
         if left_text:
             texts.append(left_text)
@@ -67,194 +257,266 @@ def extract_english_columns_text(file, first_page_hindi=True):
 
 def parse_mcqs_from_column_text(text):
     """
-    Parse questions from single-column text. Returns list of dicts: {qnum, question, options:list}.
+    Parse questions from single-column text. Yields dicts: {qnum, question, options:list}.
+    Generator so callers can stop at their question budget without parsing the rest.
     Recognizes question numbers like 'Q.1)', '1)', '1.' at line starts.
     Recognizes option lines that *start* with lowercase a/b/c/d + ')' or '.' or uppercase A/B/C/D as well.
     Ignores inline parentheses letters not at line starts.
     """
     if not text:
-        return []
+        return
     # Normalise
     text = text.replace('\r', '\n')
     # Ensure splits occur when a new question number appears at line start
-    parts = re.split(r"\n\s*(?=(?:Q\.?\s*)?\d{1,3}[\.)])", text)
-    questions = []
+    parts = _Q_SPLIT_RE.split(text)
     for p in parts:
         p = p.strip()
         if not p:
             continue
-        p_clean = re.sub(r'^(Q\.?\s*)', '', p, flags=re.IGNORECASE)
-        m = re.match(r"^(\d{1,3})[\.)]\s*(.*)$", p_clean, re.DOTALL)
+        m = _Q_HEAD_RE.match(p)
         if not m:
             continue
-        qnum = m.group(1).strip()
+        qnum = sys.intern(m.group(1).strip())
         body = m.group(2).strip()
-        # Split body into lines and find option lines that start a line
+        # Split body into lines; detect and capture option lines in a single pass
         lines = [ln for ln in body.split('\n') if ln.strip()]
         opts = []
-        q_lines = []
         option_line_idx = None
+        qtext = ''
+        extra_q_text = []
         for idx, ln in enumerate(lines):
-            if re.match(r'^[\s]*([a-dA-D]|[1-4])[\.\)]\s+', ln):
-                option_line_idx = idx
-                break
-        if option_line_idx is not None:
-            qtext = ' '.join(lines[:option_line_idx]).strip()
-            for ln in lines[option_line_idx:]:
-                mopt = re.match(r'^[\s]*([a-dA-D]|[1-4])[\.\)]\s+(.*)$', ln)
-                if mopt:
-                    label = mopt.group(1).upper()
-                    opttext = mopt.group(2).strip()
-                    # normalize labels to A-D
-                    if label in ['1','2','3','4']:
-                        label = {'1':'A','2':'B','3':'C','4':'D'}[label]
-                    opts.append((label, opttext))
+            # Three C-level char tests stand in for the option-start regex;
+            # only lines that pass pay for the capturing match
+            s = ln.lstrip()
+            is_opt_start = len(s) >= 3 and s[0] in _OPT_LABELS and s[1] in '.)' and s[2].isspace()
+            mopt = _OPT_CAPTURE_RE.match(s) if is_opt_start else None
+            if mopt:
+                if option_line_idx is None:
+                    option_line_idx = idx
+                label = mopt.group(1).upper()
+                opttext = mopt.group(2).strip()
+                # normalize labels to A-D
+                label = _NUM_TO_LETTER.get(label, label)
+                # accumulate continuation parts in a list; joined once below
+                opts.append((label, [opttext]))
+            elif option_line_idx is not None:
+                # Some option text may flow to next line; attach to last option if exists
+                if opts:
+                    opts[-1][1].append(s.rstrip())
                 else:
-                    # Some option text may flow to next line; attach to last option if exists
-                    if opts:
-                        opts[-1] = (opts[-1][0], opts[-1][1] + ' ' + ln.strip())
-                    else:
-                        # fallback — treat as part of question
-                        qtext += ' ' + ln.strip()
+                    # fallback — treat as part of question
+                    extra_q_text.append(s.rstrip())
+        if option_line_idx is not None:
+            opts = [(label, ' '.join(parts)) for label, parts in opts]
+            qtext = ' '.join(lines[:option_line_idx] + extra_q_text).strip()
         else:
             # No explicit starting option lines — try inline pattern A. option or (a) option
-            inline_opts = re.findall(r'\(?([a-dA-D])\)?[\.\)]\s*([^;\\n]+)', body)
-            if inline_opts and len(inline_opts) >= 2:
-                # question text is before first inline option
-                first_split = re.split(r'\(?[a-dA-D]\)?[\.\)]', body, maxsplit=1)
-                qtext = first_split[0].strip()
-                opts = [(lab.upper(), txt.strip()) for lab, txt in inline_opts]
+            inline_matches = list(_INLINE_OPT_RE.finditer(body))
+            if len(inline_matches) >= 2:
+                # question text is everything before the first inline option
+                qtext = body[:inline_matches[0].start()].strip()
+                opts = [(m.group(1).upper(), m.group(2).strip()) for m in inline_matches]
             else:
                 qtext = body
                 opts = []
-        # Sort opts by label A-D (in case PDF order is slightly off)
-        opts_sorted = sorted(opts, key=lambda x: 'ABCD'.index(x[0]) if x and x[0] in 'ABCD' else 99)
-        opts_texts = [t[1] for t in opts_sorted]
+        # Drop opts into their A-D slots directly (in case PDF order is slightly off)
+        slots = [''] * 4
+        for lab, txt in opts:
+            i = _LETTER_TO_IDX.get(lab)
+            if i is not None and not slots[i]:
+                slots[i] = txt
+        opts_texts = slots
         # map qnum to ensure numeric up to 100
-        questions.append({'qnum': qnum, 'question': qtext, 'options': opts_texts})
-    return questions
-
+        # options_lower / display_choices / label_by_choice are cached here so
+        # evaluation and rendering never rebuild them per rerun
+        label_by_choice = {f"{L}. {o}": L for L, o in zip(_LETTERS, opts_texts) if o and o.strip()}
+        yield {'qnum': qnum, 'question': qtext, 'options': opts_texts,
+               'options_lower': [o.lower() for o in opts_texts],
+               'display_choices': list(label_by_choice),
+               'label_by_choice': label_by_choice}
+
+@st.cache_data(max_entries=8, show_spinner=False)
 def parse_all_columns_to_questions(full_text):
     """
     full_text is concatenation of column texts in order (left col1, right col1, left col2, right col2...)
     We'll parse each column separately and then combine preserving order.
+    Cached on the text, so Streamlit reruns don't re-parse unchanged input.
     """
     if not full_text:
         return []
-    column_texts = re.split(r'\n\s*\n\s*\n', full_text) # attempt to split big gaps between columns
+    # one cheap normalisation pass (strip trailing blanks off lines), then the
+    # big-gap split between columns runs as a plain C-level str.split
+    full_text = _LINE_WS_RE.sub('\n', full_text)
+    column_texts = full_text.split('\n\n\n')
     # fallback: split by double newline if triple newline didn't appear
     if len(column_texts) == 1:
         column_texts = full_text.split('\n\n')
-    all_questions = []
-    for col_txt in column_texts:
-        col_txt = col_txt.strip()
-        if not col_txt:
-            continue
-        qlist = parse_mcqs_from_column_text(col_txt)
-        # append preserving column order
-        for q in qlist:
-            all_questions.append(q)
-            if len(all_questions) >= 100:
-                return all_questions[:100]
-    return all_questions[:100]
-
-def parse_answer_key_from_solution_pdf(file):
+    # Chain the per-column generators preserving column order and stop as soon
+    # as the 100-question budget is filled — trailing columns are never parsed.
+    stripped = (c.strip() for c in column_texts)
+    questions = itertools.chain.from_iterable(parse_mcqs_from_column_text(c) for c in stripped if c)
+    return list(itertools.islice(questions, 100))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def parse_answer_key_text(text):
     """
-    Parse answer key from solutions PDF.
+    Parse an answer key from solution text.
     This scans for patterns like:
       Q.1)  Ans) d
       1) Ans) d
       Ans) d
       1 d
-    Returns dict qnum -> letter (A-D)
+    Returns dict qnum -> letter (A-D). Cached on the text.
     """
-    pages = extract_pages_text(file)
-    text_all = []
-    for p in pages:
-        try:
-            text_all.append(p.extract_text() or "")
-        except Exception:
-            text_all.append("")
-    text = "\n".join(text_all)
+    # Main pass: remember the most recent Q-prefixed question number and bind
+    # each Ans letter to it; first binding per question wins.
     mapping = {}
-    # first try to find explicit 'Q.* Ans) X' patterns
-    matches = re.findall(r'Q\.?\s*(\d{1,3})[\)\.\s]*[^\n]{0,40}?Ans\)?\s*[:\-]?\s*([a-dA-D])', text)
-    for m in matches:
-        qnum = m[0]
-        ans = m[1].upper()
-        mapping[qnum] = ans
-    # fallback: lines with 'Ans) x' where question number above or previous
-    if not mapping:
-        # find all patterns '(\d{1,3}).*Ans) x'
-        matches2 = re.findall(r'(\d{1,3})[\)\.\s].{0,60}?Ans\)?\s*[:\-]?\s*([a-dA-D])', text)
-        for m in matches2:
-            mapping[m[0]] = m[1].upper()
-    # ultimate fallback: any 'Ans) x' sequentially map to question numbers found in order
-    if not mapping:
-        ans_seq = re.findall(r'Ans\)?\s*[:\-]?\s*([a-dA-D])', text)
-        # find qnums in text order
-        qnums = re.findall(r'\b(\d{1,3})[\)\.]\s', text)
-        # map sequentially
-        for i, ans in enumerate(ans_seq):
-            if i < len(qnums):
-                mapping[qnums[i]] = ans.upper()
-    # final cleanup normalize numbers to strings
-    # Also try matching '1) d' patterns
-    more = re.findall(r'(\d{1,3})[\)\.]\s*([a-dA-D])', text)
-    for m in more:
-        if m[0] not in mapping:
-            mapping[m[0]] = m[1].upper()
+    last_qnum = None
+    for m in _ANS_Q_TOKEN_RE.finditer(text):
+        q_pref, ans = m.groups()
+        if q_pref:
+            last_qnum = sys.intern(q_pref)
+        elif last_qnum is not None:
+            mapping.setdefault(last_qnum, ans.upper())
+    if mapping:
+        return mapping
+    # Fallback (no Q-prefixed numbers found): same scan over guarded bare
+    # numbers, explicit "1) d" pairs and Ans letters.
+    last_qnum = None
+    for m in _ANS_BARE_TOKEN_RE.finditer(text):
+        ans, pair_q, pair_a, bare_q = m.groups()
+        if ans:
+            if last_qnum is not None:
+                mapping.setdefault(last_qnum, ans.upper())
+        elif pair_q:
+            mapping.setdefault(sys.intern(pair_q), pair_a.upper())
+            last_qnum = pair_q
+        else:
+            last_qnum = sys.intern(bare_q)
     return mapping
 
+def parse_answer_key_from_solution_pdf(file):
+    """Extract the solution PDF's text and parse it into an answer key."""
+    text = "\n".join(t for t in extract_pages_text(file) if t.strip())
+    return parse_answer_key_text(text)
+
 # ---------- Evaluation & PDF generation ----------
 
+# Letter answers encoded as int8 for the JIT'd scoring loop; 0 = unattempted
+_ANS_CODE = {'': 0, 'A': 1, 'B': 2, 'C': 3, 'D': 4}
+
+if njit is not None:
+    @njit(cache=True)
+    def _score_codes(u, c, marks_per_q, negative_mark):
+        total = 0.0
+        ncorr = 0
+        ninc = 0
+        for i in range(u.size):
+            if u[i] != 0:
+                if c[i] != 0 and u[i] == c[i]:
+                    total += marks_per_q
+                    ncorr += 1
+                else:
+                    total -= negative_mark
+                    ninc += 1
+        return total, ncorr, ninc
+else:
+    _score_codes = None
+
+def normalize_answer_key(answer_key, questions):
+    """
+    Resolve free-text answer-key values to A-D letters in place, matching
+    against each question's options. Run once when the key is ingested so
+    evaluate_responses stays a plain letter comparison on every submit/rerun.
+    """
+    by_qnum = {q['qnum']: q for q in questions}
+    for qn, val in answer_key.items():
+        if not val or val in _LETTER_SET:
+            continue
+        up = val.upper()
+        if up in _LETTER_SET:
+            answer_key[qn] = up
+            continue
+        q = by_qnum.get(qn)
+        if not q:
+            continue
+        val_lower = val.lower()
+        for idx, opt_l in enumerate(q['options_lower']):
+            if val_lower in opt_l:
+                answer_key[qn] = _LETTERS[idx]
+                break
+    return answer_key
+
 def evaluate_responses(questions, user_answers, answer_key, negative_mark=0.0, marks_per_q=1.0):
-    total = 0.0
-    correct = 0
-    incorrect = 0
+    """
+    Score the exam with vectorized array comparisons. Free-text key values are
+    resolved to letters up front by normalize_answer_key, so scoring is a
+    single uppercased equality over the answer arrays. Returns
+    (total, correct, incorrect); per-question rows come from response_details.
+    """
+    if not questions:
+        return 0.0, 0, 0
+    corr_list = [(answer_key.get(q['qnum']) or '').upper() for q in questions]
+    usr_list = [(user_answers.get(q['qnum']) or '').upper() for q in questions]
+    if _score_codes is not None:
+        # JIT fast path when every answer is a plain letter or blank; free-text
+        # answers fall through to the string comparison below
+        try:
+            u = np.array([_ANS_CODE[a] for a in usr_list], dtype=np.int8)
+            c = np.array([_ANS_CODE[a] for a in corr_list], dtype=np.int8)
+        except KeyError:
+            pass
+        else:
+            total, correct, incorrect = _score_codes(u, c, float(marks_per_q), float(negative_mark))
+            return float(total), int(correct), int(incorrect)
+    corr = np.array(corr_list)
+    usr = np.array(usr_list)
+    attempted = usr != ''
+    correct_mask = attempted & (corr != '') & (corr == usr)
+    correct = int(correct_mask.sum())
+    incorrect = int((attempted & ~correct_mask).sum())
+    total = correct * marks_per_q - incorrect * negative_mark
+    return total, correct, incorrect
+
+def response_details(questions, user_answers, answer_key):
+    """Build the per-question result rows shown in the UI and the result PDF."""
     details = []
     for q in questions:
         qn = q['qnum']
         correct_ans = answer_key.get(qn)
         user_ans = user_answers.get(qn)
-        # If answer_key contains text (not letter), try to match option text
-        if correct_ans and correct_ans not in ['A','B','C','D']:
-            for idx, opt in enumerate(q['options']):
-                if correct_ans.lower() in opt.lower():
-                    correct_ans = ['A','B','C','D'][idx]
-                    break
-        is_correct = False
-        if correct_ans and user_ans:
-            try:
-                is_correct = (correct_ans.upper() == user_ans.upper())
-            except Exception:
-                is_correct = False
-        if is_correct:
-            total += marks_per_q
-            correct += 1
-        else:
-            if user_ans:
-                total -= negative_mark
-                incorrect += 1
+        is_correct = bool(correct_ans and user_ans and correct_ans.upper() == user_ans.upper())
         details.append({'qnum': qn, 'question': q['question'], 'correct': correct_ans, 'user': user_ans, 'is_correct': is_correct})
-    return total, correct, incorrect, details
+    return details
 
 def generate_result_pdf(student_name, exam_title, details, total_score, out_buffer: BytesIO):
     c = canvas.Canvas(out_buffer, pagesize=A4)
     width, height = A4
-    c.setFont('Helvetica-Bold', 14)
-    c.drawString(40, height - 40, f"Exam: {exam_title}")
-    c.setFont('Helvetica', 12)
-    c.drawString(40, height - 60, f"Student: {student_name}")
-    c.drawString(40, height - 80, f"Score: {total_score}")
-    y = height - 110
-    for d in details:
-        line = f"Q{d['qnum']}: your={d['user']} correct={d['correct']} {'✔' if d['is_correct'] else '✖'}"
-        c.drawString(40, y, line)
-        y -= 18
-        if y < 60:
+    # Header goes through one text object as well, keeping the 20pt spacing
+    head = c.beginText(40, height - 40)
+    head.setFont('Helvetica-Bold', 14, leading=20)
+    head.textLine(f"Exam: {exam_title}")
+    head.setFont('Helvetica', 12, leading=20)
+    head.textLine(f"Student: {student_name}")
+    head.textLine(f"Score: {total_score}")
+    c.drawText(head)
+    # One text object per page: build all rows up front, then chunk by page
+    # capacity and hand each page a single joined textLines call
+    rows = [f"Q{d['qnum']}: your={d['user']} correct={d['correct']} {'✔' if d['is_correct'] else '✖'}"
+            for d in details]
+    line_height = 14.4  # ReportLab default leading for 12pt Helvetica
+    start = 0
+    y_top = height - 110
+    while start < len(rows):
+        capacity = max(1, int((y_top - 60) / line_height))
+        tobj = c.beginText(40, y_top)
+        tobj.setFont('Helvetica', 12)
+        tobj.textLines("\n".join(rows[start:start + capacity]))
+        c.drawText(tobj)
+        start += capacity
+        if start < len(rows):
             c.showPage()
-            y = height - 40
+            y_top = height - 40
     c.save()
     out_buffer.seek(0)
     return out_buffer
@@ -303,6 +565,11 @@ if qfile and (not st.session_state['questions']):
         st.success(f"Parsed {len(raw_questions)} questions (showing first 100).")
     # keep first 100 only
     st.session_state['questions'] = raw_questions[:100]
+    # The answer key may have been ingested before any questions existed, in
+    # which case its free-text values couldn't be resolved — normalize again
+    # now that options are available.
+    if st.session_state['answer_key']:
+        normalize_answer_key(st.session_state['answer_key'], st.session_state['questions'])
 
 if solfile and (not st.session_state['answer_key']):
     st.info("Parsing solution PDF to build answer key...")
@@ -311,26 +578,37 @@ if solfile and (not st.session_state['answer_key']):
         st.warning("Could not parse an answer map automatically from the solution PDF — please paste the answer key manually in 'Manual key' below.")
     else:
         st.success(f"Parsed {len(key_map)} answers from solution PDF.")
-    st.session_state['answer_key'] = key_map
+    st.session_state['answer_key'] = normalize_answer_key(key_map, st.session_state['questions'])
 
 # Manual key input
 manual_key = st.text_area("Manual key (optional) — one per line, e.g. '1 A' or '1 - A'. Use this to fix or supply missing answers.", height=120)
-if manual_key:
+# Re-parse only when the paste actually changed — every other widget
+# interaction reruns this script with the same manual_key text.
+if manual_key and st.session_state.get('_manual_key_hash') != hash(manual_key):
     for ln in manual_key.splitlines():
         ln = ln.strip()
         if not ln:
             continue
-        m = re.match(r'(\d{1,3}).?[-:\)]?\s*([A-Da-d1-4])$', ln)
+        # Fast path: the common "1 A" / "12 - c" / "3) 2" shapes resolve with
+        # plain string ops; anything odd falls back to the regexes.
+        if ln[-1] in _OPT_LABELS and ln[0].isdigit():
+            qpart = ln[:-1].strip(' \t-:.)')
+            if qpart.isdigit() and len(qpart) <= 3:
+                a = ln[-1].upper()
+                st.session_state['answer_key'][sys.intern(qpart)] = _NUM_TO_LETTER.get(a, a)
+                continue
+        m = _KEY_LETTER_RE.match(ln)
         if m:
-            q = m.group(1)
+            q = sys.intern(m.group(1))
             a = m.group(2).upper()
-            if a in '1234':
-                a = {'1':'A','2':'B','3':'C','4':'D'}[a]
+            a = _NUM_TO_LETTER.get(a, a)
             st.session_state['answer_key'][q] = a
         else:
-            m2 = re.match(r'(\d{1,3}).?[-:\)]?\s*(.+)$', ln)
+            m2 = _KEY_TEXT_RE.match(ln)
             if m2:
-                st.session_state['answer_key'][m2.group(1)] = m2.group(2).strip()
+                st.session_state['answer_key'][sys.intern(m2.group(1))] = m2.group(2).strip()
+    normalize_answer_key(st.session_state['answer_key'], st.session_state['questions'])
+    st.session_state['_manual_key_hash'] = hash(manual_key)
 
 # Show parsed questions and allow edits (important)
 if st.session_state['questions']:
@@ -352,9 +630,21 @@ if st.session_state['questions']:
                 # Use `idx` in the key here as well
                 new_opt = st.text_input(f"Q{qid} option {['A','B','C','D'][i]}", value=opts[i], key=f"opt_{qid}_{idx}_{i}")
                 new_opts.append(new_opt)
-            edited_questions.append({'qnum': qid, 'question': new_qtext, 'options': new_opts})
+            if new_qtext == q['question'] and new_opts == opts:
+                # nothing edited — keep the question dict and its cached
+                # options_lower / display_choices / label_by_choice as-is
+                edited_questions.append(q)
+            else:
+                label_by_choice = {f"{L}. {o}": L for L, o in zip(_LETTERS, new_opts) if o and o.strip()}
+                edited_questions.append({'qnum': qid, 'question': new_qtext, 'options': new_opts,
+                                         'options_lower': [o.lower() for o in new_opts],
+                                         'display_choices': list(label_by_choice),
+                                         'label_by_choice': label_by_choice})
     # replace
     st.session_state['questions'] = edited_questions
+    # Edited option text can resolve previously unmatched free-text key values
+    if st.session_state['answer_key']:
+        normalize_answer_key(st.session_state['answer_key'], edited_questions)
 
 # Show brief answer key preview and mismatch check
 if st.session_state['answer_key']:
@@ -392,6 +682,18 @@ if st.session_state.get('start_time') and not st.session_state.get('submitted'):
 # Show exam form
 questions = st.session_state.get('questions', [])
 if questions and st.session_state.get('start_time') and not st.session_state.get('submitted'):
+    # Paginate the grid view: rendering 100 radio widgets per rerun dominates
+    # rerun latency, and only ~10 are ever on screen. Page navigation happens
+    # through form submit buttons so pending selections are delivered (and
+    # saved into user_answers) before the page changes — widgets inside a form
+    # only send their values to the script on a form submission.
+    page_size = 10
+    n_pages = max(1, math.ceil(len(questions) / page_size))
+    if 'exam_page' not in st.session_state:
+        st.session_state['exam_page'] = 1
+    exam_page = st.session_state['exam_page']
+    if not show_one_by_one and n_pages > 1:
+        st.markdown(f"**Question page {exam_page}/{n_pages}** — answers on other pages are kept.")
     with st.form("exam_form"):
         if show_one_by_one:
             if 'page' not in st.session_state:
@@ -399,24 +701,19 @@ if questions and st.session_state.get('start_time') and not st.session_state.get
             idx = st.session_state['page']
             q = questions[idx]
             st.write(f"**Q{q['qnum']}**. {q['question']}")
-            opts = q['options']
-            labels = ['A','B','C','D']
-            choices = []
-            for i, o in enumerate(opts):
-                if o and o.strip():
-                    choices.append(f"{labels[i]}. {o}")
+            choices = q['display_choices']
+            ua = st.session_state['user_answers']
             if not choices:
                 ans_text = st.text_area("Answer text (no options detected)", key=f"free_{q['qnum']}_{idx}")
-                if ans_text: st.session_state['user_answers'][q['qnum']] = ans_text
+                if ans_text and ua.get(q['qnum']) != ans_text:
+                    ua[q['qnum']] = ans_text
             else:
-                default_index = 0
-                if st.session_state['user_answers'].get(q['qnum']):
-                    try:
-                        default_index = labels.index(st.session_state['user_answers'][q['qnum']])
-                    except ValueError:
-                        default_index = 0
+                default_index = _LETTER_TO_IDX.get(ua.get(q['qnum']), 0)
                 sel = st.radio("Choose", choices, key=f"sel_{q['qnum']}", index=default_index)
-                if sel: st.session_state['user_answers'][q['qnum']] = sel.split('.')[0].strip()
+                if sel:
+                    ans = q['label_by_choice'].get(sel)
+                    if ans and ua.get(q['qnum']) != ans:
+                        ua[q['qnum']] = ans
 
             c1,c2,c3, c4 = st.columns(4)
             with c1:
@@ -430,26 +727,44 @@ if questions and st.session_state.get('start_time') and not st.session_state.get
             with c4:
                 submit_btn = st.form_submit_button("Submit Exam")
 
-        else: # Show all questions at once
-            # FIX 2: Use enumerate here as well for the 'show all' mode
-            for idx, q in enumerate(questions):
+        else: # Show one page of questions at a time
+            # Only the current page's widgets exist per rerun, so answers are
+            # written through user_answers here (Streamlit drops keyed widget
+            # state for widgets that are not rendered). The nav buttons below
+            # are form submits, so this render runs with the just-picked
+            # values before the page advances.
+            page_start = (exam_page - 1) * page_size
+            ua = st.session_state['user_answers']
+            # `idx` keeps widget keys unique even with duplicate qnums
+            for idx, q in enumerate(questions[page_start:page_start + page_size], start=page_start):
                 st.write(f"**Q{q['qnum']}**. {q['question']}")
-                opts = q['options']
-                labels = ['A','B','C','D']
-                choices = []
-                if any(o.strip() for o in opts):
-                    for i,o in enumerate(opts):
-                        if o and o.strip():
-                            choices.append(f"{labels[i]}. {o}")
-                    # Use `idx` in the key to make it unique
-                    sel = st.radio(f"Options for Q{q['qnum']}", choices, key=f"q_{q['qnum']}_{idx}", label_visibility="collapsed")
-                    if sel: st.session_state['user_answers'][q['qnum']] = sel.split('.')[0].strip()
+                if q['display_choices']:
+                    # index=None leaves untouched questions unselected instead
+                    # of recording option A for every rendered question
+                    saved_index = _LETTER_TO_IDX.get(ua.get(q['qnum']))
+                    sel = st.radio(f"Options for Q{q['qnum']}", q['display_choices'], key=f"q_{q['qnum']}_{idx}",
+                                   index=saved_index, label_visibility="collapsed")
+                    if sel:
+                        ans = q['label_by_choice'].get(sel)
+                        if ans and ua.get(q['qnum']) != ans:
+                            ua[q['qnum']] = ans
                 else:
-                    # Use `idx` in the key to make it unique
-                    txt = st.text_area(f"Answer for Q{q['qnum']} (no options detected)", key=f"free_{q['qnum']}_{idx}", label_visibility="collapsed")
-                    if txt: st.session_state['user_answers'][q['qnum']] = txt
+                    txt = st.text_area(f"Answer for Q{q['qnum']} (no options detected)", value=ua.get(q['qnum'], ''),
+                                       key=f"free_{q['qnum']}_{idx}", label_visibility="collapsed")
+                    if txt and ua.get(q['qnum']) != txt:
+                        ua[q['qnum']] = txt
                 st.markdown("---")
-            submit_btn = st.form_submit_button("Submit Exam")
+            p1, p2, p3, p4 = st.columns(4)
+            with p1:
+                if st.form_submit_button("Previous page"):
+                    st.session_state['exam_page'] = max(1, exam_page - 1)
+                    st.experimental_rerun()
+            with p2:
+                if st.form_submit_button("Next page"):
+                    st.session_state['exam_page'] = min(n_pages, exam_page + 1)
+                    st.experimental_rerun()
+            with p4:
+                submit_btn = st.form_submit_button("Submit Exam (all pages)")
 
         if 'submit_btn' in locals() and submit_btn:
             st.session_state['submitted'] = True
@@ -461,15 +776,20 @@ if questions and st.session_state.get('start_time') and not st.session_state.get
 
 if st.session_state.get('submitted'):
     st.header("Exam Results")
-    total, corr, inc, details = evaluate_responses(questions, st.session_state['user_answers'], st.session_state['answer_key'], negative_mark=negative_mark, marks_per_q=marks_per_q)
+    total, corr, inc = evaluate_responses(questions, st.session_state['user_answers'], st.session_state['answer_key'], negative_mark=negative_mark, marks_per_q=marks_per_q)
     st.success(f"**Score: {total}** | Correct: {corr} | Incorrect: {inc} | Unattempted: {len(questions) - (corr+inc)}")
+    details = response_details(questions, st.session_state['user_answers'], st.session_state['answer_key'])
     
     with st.expander("Per-question details"):
         for d in details:
             status = 'Correct' if d['is_correct'] else ('Wrong' if d['user'] else 'Unattempted')
             st.write(f"Q{d['qnum']}: Your answer = **{d['user'] or 'N/A'}**, Correct answer = **{d['correct']}** -> *{status}*")
     
-    buf = BytesIO()
+    # Reuse one buffer across reruns/downloads instead of growing a fresh
+    # BytesIO from zero on every rerender of the results section
+    buf = st.session_state.setdefault('_result_buf', BytesIO())
+    buf.seek(0)
+    buf.truncate(0)
     generate_result_pdf(student_name or "Student", exam_title, details, total, buf)
     st.download_button("Download Result PDF", data=buf, file_name=f"{exam_title.replace(' ','_')}_result.pdf", mime='application/pdf')
 